@@ -5,25 +5,107 @@ import hashlib
 import time
 import shutil
 import logging
-from flask import Flask, Response, request, render_template_string, send_from_directory, abort
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import threading
+import glob
+from collections import OrderedDict
+from flask import Flask, Response, request, send_from_directory, abort, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+try:
+    import pyinotify  # 仅 Linux 可用，缺失时退回轮询
+except ImportError:
+    pyinotify = None
 
 # --- 配置区域 ---
 PORT = int(os.environ.get('PORT', 8080))
-HLS_DIR = "hls_streams"
-FFMPEG_BIN = "ffmpeg"
+# 切片只存活约 30 秒，建议指向内存盘 (tmpfs，如 /dev/shm/hls_streams) 以避免磁盘 I/O；
+# 每路流约占 8 个切片 (列表 6 个 + 删除延迟 + 正在写入)，8 Mbps 源约 40 MB
+# 规范化一次 (去掉末尾的 /)，后面直接用 f-string 拼接路径
+HLS_DIR = os.path.normpath(os.environ.get('HLS_DIR') or "hls_streams")
+# 使用绝对路径，subprocess 才会走 posix_spawn 快速路径
+FFMPEG_BIN = shutil.which("ffmpeg") or "ffmpeg"
+FFPROBE_BIN = shutil.which("ffprobe") or "ffprobe"
+PROBE_TIMEOUT = 10  # 探测源音频编码的最长时间 (秒)
+STREAM_TIMEOUT = 90  # 无人访问多少秒后停止转码
+REAPER_INTERVAL = 10  # 后台清理线程的检查间隔 (秒)
+PLAYLIST_WAIT_TIMEOUT = 15  # 等待首个播放列表生成的最长时间 (秒)
+# 前置 Apache (mod_xsendfile) 或 lighttpd 时设为 1，由 Web 服务器通过 X-Sendfile 零拷贝发送切片；
+# nginx 不识别 X-Sendfile (会返回空响应)，nginx 请使用下面的 X_ACCEL_PREFIX
+USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '0') == '1'
+# 前置 nginx 时设为其 internal location (如 /internal_hls)，切片改由 nginx 直接发送，
+# 配置示例见 nginx.conf.example
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '').rstrip('/')
+
+# HLS 文件的 MIME 类型 (系统 mimetypes 可能把 .ts 识别成其他类型)
+HLS_MIMETYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+# HLS 响应固定附带的头部 (跨域 + 禁止缓存)
+HLS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Cache-Control', 'no-cache, no-store, must-revalidate'),
+)
 
 # 初始化 Flask
 app = Flask(__name__)
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+# 信任一层反向代理的 X-Forwarded-Proto/Host，生成的外部链接使用代理的协议和域名
+app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+logger.info(f"HLS_DIR: {os.path.abspath(HLS_DIR)}")
+
+class StreamEntry:
+    # 每路流一个对象，__slots__ 比 dict 占用更少内存，属性访问也更快
+    # deadline 是该条目当前在 expiry_heap 中的过期时间，用来识别堆里过时的重复项
+    __slots__ = ('process', 'last_access', 'source', 'deadline')
 
-# 存储活跃的转码进程
+    def __init__(self, process, last_access, source):
+        self.process = process
+        self.last_access = last_access
+        self.source = source
+        self.deadline = last_access + STREAM_TIMEOUT
+
+# 存储活跃的转码进程: stream_id -> StreamEntry
 active_streams = {}
+# 过期索引: (过期时间, stream_id) 小顶堆，与 active_streams 共用一把锁
+expiry_heap = []
+streams_lock = threading.RLock()
+# 正在启动中的流: stream_id -> Event，避免并发请求重复启动 FFmpeg
+spawn_events = {}
+# 播放列表内存缓存: stream_id -> (内容, 文件标识)
+playlist_cache = {}
+
+# 待删除目录的前缀，放在 HLS_DIR 内部；没删完的会被后台清理线程再次清理
+TRASH_PREFIX = ".trash-"
+
+def trash_path(name):
+    return f"{HLS_DIR}/{TRASH_PREFIX}{name}.{time.time_ns()}"
+
+def remove_paths(paths):
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
 
-# 启动时清理旧数据
-if os.path.exists(HLS_DIR):
-    shutil.rmtree(HLS_DIR)
-os.makedirs(HLS_DIR)
+# 启动时清理旧数据：HLS_DIR 可能是挂载点 (tmpfs/volume)，不能改名，
+# 只把其中内容移进回收目录，再由后台线程删除，不阻塞启动
+os.makedirs(HLS_DIR, exist_ok=True)
+startup_trash = trash_path("startup")
+os.makedirs(startup_trash)
+startup_trash_name = os.path.basename(startup_trash)
+with os.scandir(HLS_DIR) as entries:
+    for entry in entries:
+        if entry.name != startup_trash_name:
+            os.rename(entry.path, f"{startup_trash}/{entry.name}")
+# 旧版本启动时改名留下的同级目录
+old_dirs = glob.glob(f"{glob.escape(HLS_DIR)}.old.*")
+threading.Thread(target=remove_paths, args=([startup_trash] + old_dirs,), daemon=True).start()
 
 # HTML 播放器模板 (增加了错误处理提示)
 PLAYER_TEMPLATE = """
@@ -79,79 +161,302 @@ PLAYER_TEMPLATE = """
 </html>
 """
 
+# 模板只编译一次；首页没有变量，直接预渲染成字符串
+PLAYER = app.jinja_env.from_string(PLAYER_TEMPLATE)
+INDEX_HTML = PLAYER.render(source_url="", m3u8_url=None)
+
+@functools.lru_cache(maxsize=1024)
 def get_stream_id(url):
-    return hashlib.md5(url.encode('utf-8')).hexdigest()
+    # 64 位指纹足够作为字典键，ID 长度 16 个字符
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()
+
+def stop_process(process, timeout=2):
+    process.terminate()
+    # 轮询等待退出，超时后强制结束
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() > deadline:
+            process.kill()
+            process.wait()
+            return
+        time.sleep(0.05)
 
 def clean_stale_streams():
     now = time.time()
-    to_remove = []
-    for sid, data in active_streams.items():
-        if now - data["last_access"] > 90:  # 延长超时时间到 90秒
-            logger.info(f"Stream {sid} timed out, stopping...")
-            try:
-                data["process"].terminate()
-                data["process"].wait(timeout=2)
-            except:
-                data["process"].kill()
-            to_remove.append(sid)
-            shutil.rmtree(os.path.join(HLS_DIR, sid), ignore_errors=True)
-    
-    for sid in to_remove:
-        del active_streams[sid]
+    stale = []
+    with streams_lock:
+        # 只检查已到期的条目；last_access 被刷新过的重新按新的过期时间入堆
+        while expiry_heap and expiry_heap[0][0] < now:
+            popped_deadline, sid = heapq.heappop(expiry_heap)
+            entry = active_streams.get(sid)
+            # 流已移除，或该项属于同一 stream_id 之前的进程，直接丢弃
+            if entry is None or entry.deadline != popped_deadline:
+                continue
+            deadline = entry.last_access + STREAM_TIMEOUT
+            if deadline > now:
+                entry.deadline = deadline
+                heapq.heappush(expiry_heap, (deadline, sid))
+            else:
+                stale.append((sid, active_streams.pop(sid)))
 
-def start_ffmpeg(source_url, stream_id):
-    clean_stale_streams()
-    
-    output_dir = os.path.join(HLS_DIR, stream_id)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    playlist_path = os.path.join(output_dir, "index.m3u8")
-    
-    # --- 核心优化配置 ---
-    cmd = [
-        FFMPEG_BIN,
-        "-y",
-        
-        # 1. 输入流分析优化
-        "-fflags", "+genpts+discardcorrupt", # 丢弃损坏的包，重新生成时间戳
-        "-analyzeduration", "5000000",       # 分析 5秒 (提高识别率)
-        "-probesize", "5000000",             # 探测 5MB 数据
-        "-timeout", "5000000",               # 网络超时 5秒
-        
-        "-i", source_url,
-        
-        # 2. 视频处理 (保持复制，否则 CPU 爆炸)
-        "-c:v", "copy",
-        
-        # 3. 音频处理 (关键优化：转码为 AAC)
-        # 解决源是 AC3/EAC3 导致浏览器无声的问题
+    for sid, entry in stale:
+        logger.info(f"Stream {sid} timed out, stopping...")
+        try:
+            stop_process(entry.process)
+        except:
+            entry.process.kill()
+        playlist_cache.pop(sid, None)
+
+    remove_orphan_dirs()
+
+def remove_orphan_dirs():
+    # 一次扫描找出所有不属于活跃流的目录 (包括崩溃遗留的)，并行删除。
+    # 扫描和改名都在锁内完成，之后同一 stream_id 重新启动会建新目录，不会被误删
+    orphan_dirs = []
+    with streams_lock:
+        live = set(active_streams) | set(spawn_events)
+        with os.scandir(HLS_DIR) as entries:
+            for entry in entries:
+                if not entry.is_dir() or entry.name in live:
+                    continue
+                if entry.name.startswith(TRASH_PREFIX):
+                    orphan_dirs.append(entry.path)
+                    continue
+                path = trash_path(entry.name)
+                try:
+                    os.rename(entry.path, path)
+                except OSError:
+                    continue
+                orphan_dirs.append(path)
+    if not orphan_dirs:
+        return
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        executor.map(lambda path: shutil.rmtree(path, ignore_errors=True), orphan_dirs)
+
+def reaper_loop():
+    while True:
+        try:
+            clean_stale_streams()
+        except Exception:
+            logger.exception("Failed to clean stale streams")
+        time.sleep(REAPER_INTERVAL)
+
+def playlist_ready(stream_id):
+    playlist_path = os.path.join(HLS_DIR, stream_id, "index.m3u8")
+    # 再次检查文件大小，确保不是空文件
+    return os.path.exists(playlist_path) and os.path.getsize(playlist_path) > 0
+
+def watch_playlist(output_dir):
+    if pyinotify is None:
+        return None
+    try:
+        wm = pyinotify.WatchManager()
+    except OSError as e:
+        # 例如 inotify 实例数达到 fs.inotify.max_user_instances 上限，退回轮询
+        logger.warning(f"inotify unavailable, falling back to polling: {e}")
+        return None
+    # pyinotify 创建的 fd 没有 CLOEXEC，不设置的话 FFmpeg (close_fds=False) 会继承它
+    os.set_inheritable(wm.get_fd(), False)
+    notifier = pyinotify.Notifier(wm)
+    try:
+        # FFmpeg 先写 index.m3u8.tmp 再重命名，两种事件都要监听
+        wm.add_watch(output_dir, pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO, quiet=False)
+    except (OSError, pyinotify.WatchManagerError) as e:
+        logger.warning(f"Failed to watch {output_dir}, falling back to polling: {e}")
+        notifier.stop()
+        return None
+    return notifier
+
+def wait_for_playlist(stream_id, watcher):
+    deadline = time.time() + PLAYLIST_WAIT_TIMEOUT
+    try:
+        while not playlist_ready(stream_id):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if watcher is None:
+                time.sleep(min(0.5, remaining))
+            elif watcher.check_events(timeout=int(remaining * 1000)):
+                # 只把事件当作唤醒信号，读出后重新检查文件
+                watcher.read_events()
+        return True
+    finally:
+        if watcher is not None:
+            watcher.stop()
+
+def read_playlist(stream_id):
+    playlist_path = os.path.join(HLS_DIR, stream_id, "index.m3u8")
+    try:
+        st = os.stat(playlist_path)
+    except FileNotFoundError:
+        return None
+    # FFmpeg 通过重命名替换播放列表，inode 或 mtime 变化即说明内容已更新
+    stamp = (st.st_ino, st.st_mtime_ns)
+    cached = playlist_cache.get(stream_id)
+    if cached is not None and cached[1] == stamp:
+        return cached[0]
+    with open(playlist_path, 'rb') as f:
+        data = f.read()
+    playlist_cache[stream_id] = (data, stamp)
+    return data
+
+# --- 核心优化配置 ---
+# 固定参数只构建一次，启动时只拼接与流相关的部分
+# 1. 输入流分析优化 (ffprobe 探测时也使用，避免在无数据的源上长时间阻塞)
+INPUT_ANALYZE_ARGS = (
+    "-analyzeduration", "5000000",       # 分析 5秒 (提高识别率)
+    "-probesize", "5000000",             # 探测 5MB 数据
+    "-timeout", "5000000",               # 网络超时 5秒
+)
+
+FFMPEG_INPUT_ARGS = (
+    FFMPEG_BIN,
+    "-y",
+    "-fflags", "+genpts+discardcorrupt", # 丢弃损坏的包，重新生成时间戳
+) + INPUT_ANALYZE_ARGS
+
+FFMPEG_VIDEO_ARGS = (
+    # 2. 视频处理 (保持复制，否则 CPU 爆炸)
+    "-c:v", "copy",
+    "-threads", "1", # 单线程足够，避免线程在核间迁移
+)
+
+def ffmpeg_has_encoder(name):
+    try:
+        output = subprocess.check_output([FFMPEG_BIN, "-hide_banner", "-encoders"], stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return any(line.split()[1:2] == [name] for line in output.decode('utf-8', 'replace').splitlines())
+
+# 启动时检测一次 FFmpeg 是否带 libfdk_aac 编码器 (比内置 aac 编码器更快)
+HAS_FDK_AAC = ffmpeg_has_encoder("libfdk_aac")
+
+# 3. 音频处理 (关键优化：转码为 AAC)
+# 解决源是 AC3/EAC3 导致浏览器无声的问题
+if HAS_FDK_AAC:
+    AUDIO_TRANSCODE_ARGS = (
+        "-c:a", "libfdk_aac",
+        "-b:a", "96k",   # fdk-aac 在 96k 下音质与内置编码器 128k 相当
+        "-ac", "2",      # 强制双声道
+    )
+else:
+    AUDIO_TRANSCODE_ARGS = (
         "-c:a", "aac", 
         "-b:a", "128k", 
         "-ac", "2",      # 强制双声道
-        
-        # 4. HLS 切片优化 (以延迟换流畅)
-        "-f", "hls",
-        "-hls_time", "5",         # 切片改为 5秒 (原2秒) -> 更抗抖动
-        "-hls_list_size", "6",    # 列表保留 6个切片 (30秒缓冲)
-        "-hls_flags", "delete_segments+omit_endlist+split_by_time",
-        "-hls_segment_filename", os.path.join(output_dir, "%03d.ts"),
-        
-        playlist_path
-    ]
+    )
+# 源已经是 AAC 时直接复制，省掉音频编码的 CPU
+AUDIO_COPY_ARGS = ("-c:a", "copy")
+
+FFMPEG_HLS_ARGS = (
+    # 4. HLS 切片优化 (以延迟换流畅)
+    "-f", "hls",
+    "-hls_time", "5",         # 切片改为 5秒 (原2秒) -> 更抗抖动
+    "-hls_list_size", "6",    # 列表保留 6个切片 (30秒缓冲)
+    # fMP4 切片比 MPEG-TS 封装开销更小 (没有 188 字节分包)，初始化段单独写入 init.mp4
+    "-hls_segment_type", "fmp4",
+    "-hls_fmp4_init_filename", "init.mp4",
+    # 视频是直接复制，无法插入关键帧，只能在关键帧处切片，保证每个切片可独立解码
+    "-hls_flags", "delete_segments+omit_endlist+independent_segments",
+)
+
+# 音频编码探测结果: source_url -> codec_name，只缓存成功的结果
+audio_codec_cache = OrderedDict()
+audio_codec_cache_lock = threading.Lock()
+AUDIO_CODEC_CACHE_SIZE = 128
+
+def probe_audio_codec(source_url):
+    with audio_codec_cache_lock:
+        codec = audio_codec_cache.get(source_url)
+        if codec is not None:
+            audio_codec_cache.move_to_end(source_url)
+            return codec
+    cmd = (
+        (FFPROBE_BIN, "-v", "error")
+        + INPUT_ANALYZE_ARGS
+        + (
+            "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name",
+            "-of", "csv=p=0",
+            source_url,
+        )
+    )
+    try:
+        output = subprocess.check_output(cmd, stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        # 探测失败 (超时/源暂时不可达) 不缓存，下次启动时重新探测
+        return None
+    codec = output.decode('utf-8', 'replace').strip() or None
+    if codec is not None:
+        with audio_codec_cache_lock:
+            audio_codec_cache[source_url] = codec
+            audio_codec_cache.move_to_end(source_url)
+            # 超出容量时淘汰最久未使用的条目
+            while len(audio_codec_cache) > AUDIO_CODEC_CACHE_SIZE:
+                audio_codec_cache.popitem(last=False)
+    return codec
+
+def audio_args(source_url):
+    if probe_audio_codec(source_url) == "aac":
+        return AUDIO_COPY_ARGS
+    return AUDIO_TRANSCODE_ARGS
 
-    logger.info(f"Starting FFmpeg (Optimized): {source_url} -> {stream_id}")
-    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+def pin_process(pid, stream_id):
+    # 按 stream_id 把每个 FFmpeg 固定到一个 CPU 上，不支持的平台直接跳过
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(pid, {cpus[int(stream_id, 16) % len(cpus)]})
+    except (AttributeError, OSError):
+        pass
+
+def start_ffmpeg(source_url, stream_id):
+    output_dir = f"{HLS_DIR}/{stream_id}"
+    os.makedirs(output_dir, exist_ok=True)
+    
+    playlist_path = f"{output_dir}/index.m3u8"
+    # 在启动 FFmpeg 之前建立监听，避免错过播放列表的创建事件
+    watcher = watch_playlist(output_dir)
     
-    active_streams[stream_id] = {
-        "process": process,
-        "last_access": time.time(),
-        "source": source_url
-    }
+    try:
+        cmd = (
+            FFMPEG_INPUT_ARGS
+            + ("-i", source_url)
+            + FFMPEG_VIDEO_ARGS
+            + audio_args(source_url)
+            + FFMPEG_HLS_ARGS
+            + ("-hls_segment_filename", f"{output_dir}/%03d.m4s", playlist_path)
+        )
+
+        logger.info(f"Starting FFmpeg (Optimized): {source_url} -> {stream_id}")
+        # close_fds=False 且不设置 preexec_fn/cwd 时，subprocess 使用 posix_spawn 而不是 fork，
+        # Python 创建的文件描述符默认不可继承；第三方库创建的 fd 需自行设置 (见 watch_playlist)
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=False,
+        )
+        pin_process(process.pid, stream_id)
+
+        entry = StreamEntry(process, time.time(), source_url)
+        with streams_lock:
+            active_streams[stream_id] = entry
+            heapq.heappush(expiry_heap, (entry.deadline, stream_id))
+    except:
+        # 启动失败时关闭监听，避免泄漏 inotify fd
+        if watcher is not None:
+            watcher.stop()
+        raise
+
+    return watcher
+
+# 后台线程定期回收超时的转码进程，不占用请求线程
+threading.Thread(target=reaper_loop, daemon=True).start()
 
 @app.route('/')
 def index():
-    return render_template_string(PLAYER_TEMPLATE, source_url="", m3u8_url=None)
+    return INDEX_HTML
 
 @app.route('/play')
 def play():
@@ -161,41 +466,75 @@ def play():
     
     stream_id = get_stream_id(source_url)
     
-    if stream_id in active_streams:
-        if active_streams[stream_id]["process"].poll() is not None:
-            del active_streams[stream_id]
-        else:
-            active_streams[stream_id]["last_access"] = time.time()
+    spawn_event = None
+    is_spawner = False
+    with streams_lock:
+        entry = active_streams.get(stream_id)
+        if entry is not None:
+            if entry.process.poll() is not None:
+                del active_streams[stream_id]
+                entry = None
+            else:
+                entry.last_access = time.time()
+
+        if entry is None:
+            # 只有第一个请求负责启动，其余请求等待它完成
+            spawn_event = spawn_events.get(stream_id)
+            if spawn_event is None:
+                spawn_event = spawn_events[stream_id] = threading.Event()
+                is_spawner = True
     
-    if stream_id not in active_streams:
-        start_ffmpeg(source_url, stream_id)
-        # 增加等待时间，因为切片变大了
-        retries = 30 
-        while retries > 0:
-            if os.path.exists(os.path.join(HLS_DIR, stream_id, "index.m3u8")):
-                # 再次检查文件大小，确保不是空文件
-                if os.path.getsize(os.path.join(HLS_DIR, stream_id, "index.m3u8")) > 0:
-                    break
-            time.sleep(0.5)
-            retries -= 1
-
-    scheme = "https" if request.headers.get('X-Forwarded-Proto') == 'https' else "http"
-    m3u8_url = f"{scheme}://{request.host}/hls/{stream_id}/index.m3u8"
+    if is_spawner:
+        try:
+            watcher = start_ffmpeg(source_url, stream_id)
+            # 等待首个播放列表生成 (有 inotify 时由事件唤醒)
+            if not wait_for_playlist(stream_id, watcher):
+                logger.warning(f"Stream {stream_id} playlist not ready after {PLAYLIST_WAIT_TIMEOUT}s")
+        finally:
+            with streams_lock:
+                del spawn_events[stream_id]
+            spawn_event.set()
+    elif spawn_event is not None:
+        # 启动方最多花 PROBE_TIMEOUT 探测音频，再花 PLAYLIST_WAIT_TIMEOUT 等播放列表
+        spawn_event.wait(timeout=PROBE_TIMEOUT + PLAYLIST_WAIT_TIMEOUT)
+
+    m3u8_url = url_for('serve_hls', stream_id=stream_id, filename='index.m3u8', _external=True)
     
-    return render_template_string(PLAYER_TEMPLATE, source_url=source_url, m3u8_url=m3u8_url)
+    return PLAYER.render(source_url=source_url, m3u8_url=m3u8_url)
 
 @app.route('/hls/<stream_id>/<filename>')
 def serve_hls(stream_id, filename):
-    if stream_id in active_streams:
-        active_streams[stream_id]["last_access"] = time.time()
+    # 只查一次字典，后面复用同一个对象
+    entry = active_streams.get(stream_id)
+    if entry is not None:
+        entry.last_access = time.time()
     
+    # 活跃流的播放列表从内存返回，只需一次 stat
+    if filename == "index.m3u8" and entry is not None:
+        data = read_playlist(stream_id)
+        if data is None:
+            return abort(404)
+        return Response(data, mimetype=HLS_MIMETYPES[".m3u8"], headers=HLS_HEADERS)
+
+    ext = os.path.splitext(filename)[1]
+    mimetype = HLS_MIMETYPES.get(ext)
+
+    # 切片交给 nginx (directio/sendfile)，这里只负责刷新访问时间
+    if X_ACCEL_PREFIX and ext != ".m3u8" and mimetype and entry is not None:
+        response = Response(mimetype=mimetype, headers=HLS_HEADERS)
+        response.headers['X-Accel-Redirect'] = f"{X_ACCEL_PREFIX}/{stream_id}/{filename}"
+        return response
+
     try:
-        response = send_from_directory(os.path.join(HLS_DIR, stream_id), filename)
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        # send_from_directory 会使用 wsgi.file_wrapper，gunicorn 下走 sendfile(2)；
+        # 开启 USE_X_SENDFILE 时只返回头部，由前置服务器发送文件内容
+        response = send_from_directory(os.path.join(HLS_DIR, stream_id), filename, mimetype=mimetype)
+        # send_file 已经写入 Cache-Control: no-cache，用 update 覆盖而不是追加
+        response.headers.update(HLS_HEADERS)
         return response
     except FileNotFoundError:
         return abort(404)
 
 if __name__ == '__main__':
+    # 仅用于本地调试，生产环境使用 gunicorn (见 Dockerfile)
     app.run(host='0.0.0.0', port=PORT, threaded=True)